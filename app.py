@@ -1,13 +1,20 @@
 import os
 import re
+import hmac
+import base64
+import hashlib
 import time
-import json
+import heapq
+import html
+import threading
 import datetime as dt
-from typing import List, Tuple, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Dict, Optional
 
+import orjson
 import requests
 import urllib3
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
 from flask import Flask, request, jsonify
 
 # 關閉 requests 對 verify=False 的警告（TWSE/TPEx 憑證鏈在某些環境會驗證失敗）
@@ -15,25 +22,36 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 # ========= Flask =========
 app = Flask(__name__)
+# Flask 的 logger 預設沿用 root 的 WARNING（gunicorn 下也是）：掃描的 info 統計要看得到，等級由 LOG_LEVEL 決定
+app.logger.setLevel(os.getenv("LOG_LEVEL", "INFO").strip().upper() or "INFO")
 
 # ========= LINE =========
 LINE_CHANNEL_ACCESS_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN", "").strip()
 LINE_USER_ID = os.getenv("LINE_USER_ID", "").strip()
+LINE_CHANNEL_SECRET = os.getenv("LINE_CHANNEL_SECRET", "").strip()  # 有設才驗 webhook 簽章
+# 金鑰排程（inner/outer pad）只算一次；每個 webhook 從這份 copy() 出來再 update body
+LINE_SIGNATURE_HMAC = hmac.new(LINE_CHANNEL_SECRET.encode("utf-8"), digestmod=hashlib.sha256)
 
-def line_push(text: str) -> Tuple[bool, str]:
-    """用 Messaging API 直接打 HTTPS 送訊息（不依賴 line-bot-sdk）"""
+LINE_MAX_MESSAGES_PER_PUSH = 5  # push API 一次最多帶 5 則訊息
+LINE_PUSH_URL = "https://api.line.me/v2/bot/message/push"
+# token 在啟動時就固定了，標頭建一次重複使用
+LINE_HEADERS = {
+    "Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}",
+    "Content-Type": "application/json"
+}
+
+def line_push(texts: List[str]) -> Tuple[bool, str]:
+    """
+    用 Messaging API 直接打 HTTPS 送訊息（不依賴 line-bot-sdk）。
+    一次最多 LINE_MAX_MESSAGES_PER_PUSH 則，同一個 request 內依序送達。
+    """
     if not LINE_CHANNEL_ACCESS_TOKEN or not LINE_USER_ID:
         return False, "Missing LINE env"
-    url = "https://api.line.me/v2/bot/message/push"
-    headers = {
-        "Authorization": f"Bearer {LINE_CHANNEL_ACCESS_TOKEN}",
-        "Content-Type": "application/json"
-    }
     payload = {
         "to": LINE_USER_ID,
-        "messages": [{"type": "text", "text": text}]
+        "messages": [{"type": "text", "text": t} for t in texts[:LINE_MAX_MESSAGES_PER_PUSH]]
     }
-    r = requests.post(url, headers=headers, data=json.dumps(payload), timeout=15)
+    r = SESSION.post(LINE_PUSH_URL, headers=LINE_HEADERS, data=orjson.dumps(payload), timeout=15)
     ok = (200 <= r.status_code < 300)
     return ok, f"{r.status_code} {r.text[:200]}"
 
@@ -50,37 +68,77 @@ MIN_CHANGE_PCT     = env_float("MIN_CHANGE_PCT",  0.5)     # 當日漲幅門檻(
 MIN_VOLUME         = env_int  ("MIN_VOLUME",      100)     # 當日量門檻（股）
 MAX_LINES_PER_MSG  = env_int  ("MAX_LINES_PER_MSG", 25)    # 每則訊息最多行數
 MAX_CHARS_PER_MSG  = env_int  ("MAX_CHARS_PER_MSG", 1800)  # 每則訊息最多字元（留安全餘裕）
+MAX_WORKERS        = env_int  ("MAX_WORKERS",      16)     # Yahoo 並行抓取數
+QUOTE_TTL_SEC      = env_int  ("QUOTE_TTL_SEC",    60)     # 個股報價快取秒數（重試/重複推播不重抓）
+QUOTE_NEG_TTL_SEC  = env_int  ("QUOTE_NEG_TTL_SEC", 10)    # 抓不到報價的代號多久內不再重打
+
+# ========= HTTP：共用 Session（keep-alive 連線池，免每次重做 TCP+TLS）=========
+# 每個 host 的連線池至少要容納 MAX_WORKERS 條，否則並行抓取時多出來的連線用完即丟
+SESSION = requests.Session()
+SESSION.headers.update({
+    # 預設的 python-requests UA 容易被 Yahoo 回 429
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+                  "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+})
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=max(MAX_WORKERS, 4),
+    max_retries=urllib3.Retry(total=2, backoff_factor=0.2, status_forcelist=[429, 500, 502, 503, 504]),
+))
+
+# ========= 時間（台北，UTC+8；tzinfo 只建一次）=========
+TW_TZ = dt.timezone(dt.timedelta(hours=8))
+
+def _tw_now() -> dt.datetime:
+    return dt.datetime.now(TW_TZ)
 
 # ========= 代號清單快取 =========
 SYMBOLS_CACHE: Dict[str, dict] = {
     "ts": 0.0,
-    "items": []  # 每筆：{"code": "2330", "name": "台積電", "market": "上市|上櫃|ETF", "yahoo": "2330.TW"}
+    "items": []  # 每筆：{"code": "2330", "name": "台積電", "market": "上市|上櫃", "yahoo": "2330.TW", "group": "上市|上櫃|ETF"}
 }
 CACHE_TTL_SEC = 60 * 60 * 6  # 6 小時
+SYMBOLS_CACHE_DIR = os.getenv("SYMBOLS_CACHE_DIR", "/tmp").strip() or "/tmp"  # 當日清單落地快取（跨重啟/跨 worker）
+SYMBOLS_FILE_RE   = re.compile(r"^symbols_\d{8}\.json$")  # 落地檔名：symbols_YYYYMMDD.json
+SYMBOLS_FILES_KEEP = 2  # 保留最新幾天的落地檔（今天 + 前一天，給 ISIN 掛掉時備援）
 
 TWSE_LISTED_URL  = "https://isin.twse.com.tw/isin/C_public.jsp?strMode=2"  # 上市（含 ETF）
 TPEX_OTC_URL     = "https://isin.twse.com.tw/isin/C_public.jsp?strMode=4"  # 上櫃
+ISIN_ENCODING    = "cp950"  # ISIN 頁面宣告 MS950（Big5 超集）
+
+# 逐列比對的 pattern 先編譯好，迴圈內不再查 re 的內部快取
+# 代號只收常見的股票與 ETF 格式（4 碼可帶 1 個英文字母，或 2 字母 + 2 數字），一次比對同時切出代號與名稱
+CODE_NAME_RE  = re.compile(r"^(\d{4}[A-Z]?|[A-Z]{2}\d{2})\s+(.+)$")  # 例：2330 台積電
+# ISIN 頁面結構固定（<tr><td>代號 名稱</td><td>...</td>...</tr>），直接用 regex 取列與格，不建 DOM
+TR_RE  = re.compile(r"<tr[^>]*>(.*?)</tr>", re.S | re.I)
+TD_RE  = re.compile(r"<td[^>]*>(.*?)</td>", re.S | re.I)
+TAG_RE = re.compile(r"<[^>]+>")
 
 # ========= 工具：抓上市/上櫃 HTML 表格，回傳 (code,name,market) =========
 def _fetch_isin_table(url: str, market_label: str) -> List[Tuple[str, str, str]]:
     # verify=False 解決憑證鏈驗證問題
-    r = requests.get(url, timeout=20, verify=False)
+    r = SESSION.get(url, timeout=20, verify=False)
     r.raise_for_status()
-    soup = BeautifulSoup(r.text, "html.parser")
-    rows = soup.select("table.h4 tr") or soup.find_all("tr")
+    page = r.content.decode(ISIN_ENCODING, errors="replace")
     out: List[Tuple[str, str, str]] = []
-    for tr in rows:
-        tds = [td.get_text(strip=True) for td in tr.find_all("td")]
-        if not tds or len(tds) < 2:
+    skip_section = False
+    for row in TR_RE.finditer(page):
+        body = row.group(1)
+        # 區段標題列（股票、ETF、上市認購(售)權證…）是單一跨欄格：
+        # 權證區段動輒上萬列且代號一律不符，整段略過、連格子都不拆
+        if "colspan" in body:
+            skip_section = "權證" in body
             continue
-        raw = tds[0]  # 例：2330 台積電
-        m = re.match(r"^([A-Z0-9]+)\s+(.+)$", raw)
-        if not m:
+        if skip_section:
             continue
-        code, name = m.group(1), m.group(2)
-        # 只收常見的股票與 ETF 代號
-        if re.fullmatch(r"\d{4}[A-Z]?", code) or re.fullmatch(r"[A-Z]{2}\d{2}", code):
-            out.append((code, name, market_label))
+        # 只需要第一格：search 找到就停，不把整列七格都切出來
+        td = TD_RE.search(body)
+        if not td:
+            continue
+        raw = html.unescape(TAG_RE.sub("", td.group(1))).strip()  # 例：2330 台積電
+        m = CODE_NAME_RE.match(raw)
+        if m:
+            out.append((m.group(1), m.group(2), market_label))
     return out
 
 def _yahoo_symbol(code: str, market: str) -> str:
@@ -88,79 +146,150 @@ def _yahoo_symbol(code: str, market: str) -> str:
     suffix = ".TWO" if market == "上櫃" else ".TW"
     return f"{code}{suffix}"
 
+# ========= 代號清單落地快取（以台北日期為 key，一天只爬一次）=========
+def _symbols_cache_path() -> str:
+    today = _tw_now().strftime("%Y%m%d")
+    return os.path.join(SYMBOLS_CACHE_DIR, f"symbols_{today}.json")
+
+def _load_symbols_file(path: Optional[str] = None) -> List[dict]:
+    try:
+        with open(path or _symbols_cache_path(), "rb") as f:
+            items = orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return []
+    return items if isinstance(items, list) else []
+
+def _symbols_file_names() -> List[str]:
+    """目錄內的落地清單檔名，舊到新排序（檔名含日期，字典序即時間序）"""
+    try:
+        return sorted(n for n in os.listdir(SYMBOLS_CACHE_DIR) if SYMBOLS_FILE_RE.match(n))
+    except OSError:
+        return []
+
+def _latest_symbols_file() -> Optional[str]:
+    """最近一天的落地清單（ISIN 頁面掛掉時退而求其次用）"""
+    names = _symbols_file_names()
+    return os.path.join(SYMBOLS_CACHE_DIR, names[-1]) if names else None
+
+def _prune_symbols_files() -> None:
+    """每天一個檔，不清就會一直長：只留最新 SYMBOLS_FILES_KEEP 個"""
+    for name in _symbols_file_names()[:-SYMBOLS_FILES_KEEP]:
+        try:
+            os.remove(os.path.join(SYMBOLS_CACHE_DIR, name))
+        except OSError as e:
+            app.logger.warning("symbols cache cleanup failed for %s: %s", name, e)
+
+def _save_symbols_file(items: List[dict]) -> None:
+    path = _symbols_cache_path()
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(orjson.dumps(items))
+        os.replace(tmp, path)  # 原子替換，其他 worker 不會讀到半個檔
+    except OSError as e:
+        app.logger.warning("symbols cache write failed: %s", e)
+        return
+    _prune_symbols_files()
+
+def _scan_group(name: str, market: str) -> str:
+    # 粗略判定 ETF：名稱含「ETF」
+    return "ETF" if ("ETF" in name.upper()) else ("上櫃" if market == "上櫃" else "上市")
+
 def get_all_symbols(force: bool = False) -> List[dict]:
     now = time.time()
     if not force and (now - SYMBOLS_CACHE["ts"] < CACHE_TTL_SEC) and SYMBOLS_CACHE["items"]:
         return SYMBOLS_CACHE["items"]
+    if not force:
+        cached = _load_symbols_file()
+        if cached:
+            SYMBOLS_CACHE["ts"] = now
+            SYMBOLS_CACHE["items"] = cached
+            return cached
 
-    items: List[dict] = []
     try:
         listed = _fetch_isin_table(TWSE_LISTED_URL, "上市")     # 含 ETF
         otc    = _fetch_isin_table(TPEX_OTC_URL, "上櫃")
+        # 去重（以 code 為主，先出現者為準）：dict 同時當 seen 集合與保序容器，重複的代號不建 item
+        by_code: Dict[str, dict] = {}
         for code, name, market in listed + otc:
-            items.append({
+            if code in by_code:
+                continue
+            by_code[code] = {
                 "code": code,
                 "name": name,
                 "market": market,
-                "yahoo": _yahoo_symbol(code, market)
-            })
-        # 去重（以 code 為主）
-        seen = set()
-        uniq: List[dict] = []
-        for it in items:
-            if it["code"] in seen:
-                continue
-            seen.add(it["code"])
-            uniq.append(it)
+                "yahoo": _yahoo_symbol(code, market),
+                "group": _scan_group(name, market),
+            }
+        uniq = list(by_code.values())
         SYMBOLS_CACHE["ts"] = now
         SYMBOLS_CACHE["items"] = uniq
+        if uniq:
+            _save_symbols_file(uniq)
         return uniq
     except Exception as e:
-        # 失敗時仍回舊快取（若有）
+        # 失敗時仍回舊快取（若有）；剛重啟、記憶體沒有的話改讀最近一天的落地檔
         if SYMBOLS_CACHE["items"]:
             return SYMBOLS_CACHE["items"]
+        latest = _latest_symbols_file()
+        stale = _load_symbols_file(latest) if latest else []
+        if stale:
+            app.logger.warning("symbol list fetch failed (%s), using stale %s", e, latest)
+            SYMBOLS_CACHE["items"] = stale  # ts 不更新：下次呼叫仍會再試著重抓
+            return stale
         raise e
 
 # ========= 抓 Yahoo 當日變化（簡易、免金鑰）=========
+YAHOO_CHART_URL  = "https://query1.finance.yahoo.com/v8/finance/chart/{}"
+YAHOO_SPARK_URL  = "https://query1.finance.yahoo.com/v8/finance/spark"
+CHART_ATTEMPTS   = (("5d", "1d"), ("1d", "1m"))  # 單檔 chart 依序嘗試的 (range, interval)
+SPARK_BATCH_SIZE = 20  # spark 一次最多 20 檔
+
+def _scan_closes(closes: list, volumes: list) -> Tuple[Optional[float], Optional[float], int]:
+    """由序列尾端找 (最後價, 前一筆收盤, 最後量)；None 代表缺值"""
+    last_price = None
+    last_volume = 0
+    # 一次反向掃描：第一個有效值為最後價，再往前一個有效值視為昨收
+    for i in range(len(closes) - 1, -1, -1):
+        c = closes[i]
+        if c is None:
+            continue
+        if last_price is not None:
+            return last_price, c, last_volume
+        last_price = c
+        last_volume = int((volumes[i] if i < len(volumes) else 0) or 0)
+    return last_price, None, last_volume
+
 def fetch_change_pct_and_volume(yahoo_symbol: str) -> Tuple[float, int]:
     """
     回傳：(當日漲跌幅%, 當日成交量)
-    先試 1d/1m 內盤；若拿不到改 5d/1d（最近日線）。
+    先試 5d/1d（日線，盤中也含今日累計量，資料量小）；拿不到才改 1d/1m 內盤。
     """
-    urls = [
-        f"https://query1.finance.yahoo.com/v8/finance/chart/{yahoo_symbol}?range=1d&interval=1m",
-        f"https://query1.finance.yahoo.com/v8/finance/chart/{yahoo_symbol}?range=5d&interval=1d",
-    ]
+    url = YAHOO_CHART_URL.format(yahoo_symbol)
     last_close = None
     last_price = None
     last_volume = 0
 
-    for url in urls:
-        r = requests.get(url, timeout=10)
-        if r.status_code != 200:
-            continue
-        j = r.json()
-        result = j.get("chart", {}).get("result", [])
-        if not result:
+    for rng, interval in CHART_ATTEMPTS:
+        # with：讀完 body 就立刻把連線還給連線池（並行時不會堆積未關閉的 socket）
+        with SESSION.get(url, params={"range": rng, "interval": interval, "includePrePost": "false"}, timeout=10) as r:
+            if r.status_code != 200:
+                continue
+            j = orjson.loads(r.content)
+        # 正常回應直接索引；結構缺一層（無資料、代號錯）就換下一組 range/interval
+        try:
+            result = j["chart"]["result"][0]
+            quote = result["indicators"]["quote"][0]
+            closes = quote["close"] or []
+        except (KeyError, IndexError, TypeError):
             continue
-        indicators = result[0].get("indicators", {})
-        quote = (indicators.get("quote") or [{}])[0]
-        closes = quote.get("close") or []
         volumes = quote.get("volume") or []
-        # 最後有效值
-        for i in range(len(closes) - 1, -1, -1):
-            c = closes[i]
-            v = volumes[i] if i < len(volumes) else 0
-            if c is not None:
-                last_price = c
-                last_volume = int(v or 0)
-                break
-        # 前一筆視為昨收
-        for i in range(len(closes) - 2, -1, -1):
-            c = closes[i]
-            if c is not None:
-                last_close = c
-                break
+        last_price, last_close, last_volume = _scan_closes(closes, volumes)
+        if interval == "1m":
+            # 分K 的前一根只是上一分鐘：昨收改取 meta，量改取當日累計（沒有就把各分鐘加總）
+            meta = result.get("meta") or {}
+            last_close = meta.get("chartPreviousClose") or meta.get("previousClose")
+            last_volume = int(meta.get("regularMarketVolume") or sum(v for v in volumes if v))
         if last_price is not None and last_close is not None:
             break
 
@@ -169,6 +298,132 @@ def fetch_change_pct_and_volume(yahoo_symbol: str) -> Tuple[float, int]:
     change_pct = (last_price - last_close) / last_close * 100.0
     return round(change_pct, 2), last_volume
 
+def fetch_changes_batch(yahoo_symbols: List[str]) -> Dict[str, float]:
+    """
+    一次請求最多 SPARK_BATCH_SIZE 檔（spark 端點，日線 5d/1d），回 { yahoo_symbol: 當日漲跌幅% }。
+    v8 spark 回的是以代號為 key 的物件，每檔只有 close / timestamp / chartPreviousClose 等欄位，
+    沒有成交量：量要另外打 chart 拿。抓不到的代號不會出現在結果中。
+    例：{"2330.TW": {"symbol": "2330.TW", "close": [1035.0, null, 1050.0], "chartPreviousClose": 1030.0, ...}}
+    """
+    with SESSION.get(YAHOO_SPARK_URL, params={
+        "symbols": ",".join(yahoo_symbols),
+        "range": "5d",
+        "interval": "1d",
+        # 只用到 close：不要時間戳陣列、不要盤前盤後（timestamp 欄位不會被讀，缺了也不影響解析）
+        "includeTimestamps": "false",
+        "includePrePost": "false",
+    }, timeout=10) as r:
+        if r.status_code != 200:
+            return {}
+        j = orjson.loads(r.content)
+    out: Dict[str, float] = {}
+    if not isinstance(j, dict):
+        return out
+    for sym, res in j.items():
+        # 錯誤回應（{"finance": {"error": ...}}）或缺 close 的代號都跳過
+        if not isinstance(res, dict) or not isinstance(res.get("close"), list):
+            continue
+        last_price, last_close, _ = _scan_closes(res["close"], ())
+        if last_price is not None and last_close is None:
+            # 區間內只有一筆（剛上市）：前一日收盤就是區間起點前的 chartPreviousClose
+            last_close = res.get("chartPreviousClose")
+        if not last_price or not last_close:
+            continue
+        out[res.get("symbol") or sym] = round((last_price - last_close) / last_close * 100.0, 2)
+    return out
+
+def _safe_fetch(yahoo_symbol: str) -> Optional[Tuple[float, int]]:
+    """單檔失敗就跳過（回 None），不影響整體掃描"""
+    try:
+        return fetch_change_pct_and_volume(yahoo_symbol)
+    except Exception as e:
+        app.logger.debug("chart fetch failed for %s: %s", yahoo_symbol, e)
+        return None
+
+def _safe_fetch_batch(yahoo_symbols: List[str]) -> Dict[str, float]:
+    """單批失敗就跳過（回空 dict），不影響整體掃描"""
+    try:
+        return fetch_changes_batch(yahoo_symbols)
+    except Exception as e:
+        app.logger.warning("spark batch failed (%d symbols, first %s): %s", len(yahoo_symbols), yahoo_symbols[0], e)
+        return {}
+
+# ========= 報價短期快取 =========
+# 掃描共用的執行緒池：建一次重複使用，不在每輪掃描都開/關 MAX_WORKERS 條執行緒
+SCAN_EXECUTOR = ThreadPoolExecutor(max_workers=max(1, MAX_WORKERS), thread_name_prefix="scan")
+# yahoo_symbol -> (抓取時間, (chg%, vol))；值為 None 表示上次抓不到（負快取，只留 QUOTE_NEG_TTL_SEC）
+QUOTE_CACHE: Dict[str, Tuple[float, Optional[Tuple[float, int]]]] = {}
+# yahoo_symbol -> (抓取時間, chg%)：spark 預篩的結果（沒有量），未達門檻的代號靠它免重抓
+SPARK_CACHE: Dict[str, Tuple[float, float]] = {}
+# 累計次數，/list 可查；spark_hit 掉到 0、chart_fallback 暴增就表示 spark 那條路壞了
+QUOTE_CACHE_STATS: Dict[str, int] = {"hit": 0, "neg_hit": 0, "miss": 0, "spark_hit": 0, "chart_fallback": 0}
+
+def fetch_changes(yahoo_symbols: List[str], min_change_pct: float) -> Dict[str, Tuple[float, int]]:
+    """
+    回 { yahoo_symbol: (當日漲跌幅%, 當日成交量) }，只含漲幅可能達 min_change_pct 的代號。
+    1. 先用 spark 分批（每批 SPARK_BATCH_SIZE 檔一次往返）算漲幅，未達門檻的直接淘汰、不必再抓量；
+    2. 過門檻的、以及 spark 沒回的代號，才逐檔打 chart 拿成交量（漲幅也以 chart 為準）。
+    兩段結果都快取 QUOTE_TTL_SEC；chart 也抓不到的在 QUOTE_NEG_TTL_SEC 內直接略過。
+    """
+    now = time.time()
+    quotes: Dict[str, Tuple[float, int]] = {}
+    misses: List[str] = []      # 沒有任何快取：先過 spark
+    need_chart: List[str] = []  # spark 快取說漲幅夠：直接打 chart 拿量
+    hits = neg_hits = 0
+    for ysym in yahoo_symbols:
+        hit = QUOTE_CACHE.get(ysym)
+        if hit is not None:
+            if hit[1] is None:
+                if now - hit[0] < QUOTE_NEG_TTL_SEC:
+                    neg_hits += 1
+                    continue
+            elif now - hit[0] < QUOTE_TTL_SEC:
+                quotes[ysym] = hit[1]
+                hits += 1
+                continue
+        pre = SPARK_CACHE.get(ysym)
+        if pre is not None and now - pre[0] < QUOTE_TTL_SEC:
+            if pre[1] >= min_change_pct:
+                need_chart.append(ysym)
+            else:
+                hits += 1  # 快取內就知道漲幅不夠，不必抓
+            continue
+        misses.append(ysym)
+    QUOTE_CACHE_STATS["hit"] += hits
+    QUOTE_CACHE_STATS["neg_hit"] += neg_hits
+    QUOTE_CACHE_STATS["miss"] += len(misses) + len(need_chart)
+    app.logger.info("quote cache: %d hit, %d negative hit, %d miss", hits, neg_hits, len(misses) + len(need_chart))
+
+    batches = [misses[i:i + SPARK_BATCH_SIZE] for i in range(0, len(misses), SPARK_BATCH_SIZE)]
+    if batches:
+        priced: Dict[str, float] = {}
+        for part in SCAN_EXECUTOR.map(_safe_fetch_batch, batches):
+            priced.update(part)
+        # 時間戳記在抓完之後才取：掃描再慢，快取也是從資料到手那一刻起算 TTL
+        fetched_at = time.time()
+        SPARK_CACHE.update((ysym, (fetched_at, chg)) for ysym, chg in priced.items())
+        # spark 沒回的代號當作「可能過門檻」，交給 chart 補抓
+        fallback = [ysym for ysym in misses if ysym not in priced]
+        need_chart.extend(ysym for ysym, chg in priced.items() if chg >= min_change_pct)
+        need_chart.extend(fallback)
+        QUOTE_CACHE_STATS["spark_hit"] += len(priced)
+        QUOTE_CACHE_STATS["chart_fallback"] += len(fallback)
+        if not priced:
+            app.logger.warning("spark priced none of %d symbols; all of them fell back to chart", len(misses))
+        else:
+            app.logger.info("spark priced %d of %d symbols, %d fell back to chart", len(priced), len(misses), len(fallback))
+
+    if need_chart:
+        fetched: Dict[str, Tuple[float, int]] = {}
+        for ysym, q in zip(need_chart, SCAN_EXECUTOR.map(_safe_fetch, need_chart)):
+            # (0.0, 0) 是 chart 端點「沒資料」的回傳值：和抓失敗一樣當負快取，短時間內不再重打
+            if q is not None and q != (0.0, 0):
+                fetched[ysym] = q
+        quotes.update(fetched)
+        fetched_at = time.time()
+        QUOTE_CACHE.update((ysym, (fetched_at, fetched.get(ysym))) for ysym in need_chart)
+    return quotes
+
 # ========= 過濾 + 排序 =========
 def pick_rising_all(
     min_change_pct: float,
@@ -180,52 +435,63 @@ def pick_rising_all(
     內容每筆：(code, name, chg%, vol)
     """
     symbols = get_all_symbols()
-    groups = {"上市": [], "上櫃": [], "ETF": []}
+    quotes = fetch_changes([s["yahoo"] for s in symbols], min_change_pct)
 
-    for s in symbols:
-        code, name, market, ysym = s["code"], s["name"], s["market"], s["yahoo"]
-        # 粗略判定 ETF：名稱含「ETF」
-        sub_group = "ETF" if ("ETF" in name.upper()) else ("上櫃" if market == "上櫃" else "上市")
-        try:
-            chg, vol = fetch_change_pct_and_volume(ysym)
-        except Exception:
+    # 邊掃邊篩：每組只留一個大小 top_k 的最小堆，不先收齊再排序
+    # 堆元素 (chg, vol, -i, ...)：同分時先出現者勝出，與原本穩定排序的結果一致
+    heaps: Dict[str, list] = {"上市": [], "上櫃": [], "ETF": []}
+    for i, s in enumerate(symbols):
+        quote = quotes.get(s["yahoo"])
+        if quote is None:
             continue
-        if chg >= min_change_pct and vol >= min_volume:
-            groups[sub_group].append((code, name, chg, vol))
+        chg, vol = quote
+        if chg < min_change_pct or vol < min_volume:
+            continue
+        entry = (chg, vol, -i, s["code"], s["name"])
+        # 分組在建清單時就算好了（s["group"]），掃描時不再逐檔判斷
+        h = heaps[s["group"]]
+        if len(h) < top_k:
+            heapq.heappush(h, entry)
+        elif h and entry > h[0]:
+            heapq.heapreplace(h, entry)
 
-    for k in groups:
-        groups[k].sort(key=lambda x: (x[2], x[3]), reverse=True)
-        groups[k] = groups[k][:top_k]
-    return groups
+    return {
+        label: [(code, name, chg, vol) for chg, vol, _, code, name in sorted(h, reverse=True)]
+        for label, h in heaps.items()
+    }
 
 # ========= 格式化成多則訊息 =========
 def make_messages(groups: Dict[str, List[Tuple[str, str, float, int]]]) -> List[str]:
-    now = dt.datetime.now(dt.timezone(dt.timedelta(hours=8)))
-    ts = now.strftime("%Y-%m-%d %H:%M")
-    parts: List[str] = []
+    ts = _tw_now().strftime("%Y-%m-%d %H:%M")
+    # 每組直接保留「行」的 list 交給下面分段，不先 join 成整段再 splitlines 拆回來
+    parts: List[List[str]] = []
     for label in ("上市", "上櫃", "ETF"):
         rows = groups.get(label, [])
         if not rows:
             continue
         lines = [f"【{ts} 起漲清單】📈 {label}"]
-        for i, (code, name, chg, vol) in enumerate(rows, 1):
-            lines.append(f"{i}. {code} {name}  漲幅 {chg:.2f}%  量 {vol:,}")
-        msg = "\n".join(lines)
-        parts.append(msg)
+        lines.extend(
+            f"{i}. {code} {name}  漲幅 {chg:.2f}%  量 {vol:,}"
+            for i, (code, name, chg, vol) in enumerate(rows, 1)
+        )
+        parts.append(lines)
 
     if not parts:
-        parts = [f"【{ts} 起漲清單】\n尚無符合條件的個股（或資料未更新）"]
+        parts = [[f"【{ts} 起漲清單】", "尚無符合條件的個股（或資料未更新）"]]
     # 分段（字數/行數保護）
     final: List[str] = []
-    for p in parts:
-        block = []
-        curr = 0
-        for line in p.splitlines():
-            if len("\n".join(block + [line])) > MAX_CHARS_PER_MSG or len(block) >= MAX_LINES_PER_MSG:
+    for lines in parts:
+        block: List[str] = []
+        block_chars = 0  # 目前 block 以 "\n" 串起來的長度，免每行重 join 一次
+        for line in lines:
+            added = len(line) + (1 if block else 0)
+            if block and (block_chars + added > MAX_CHARS_PER_MSG or len(block) >= MAX_LINES_PER_MSG):
                 final.append("\n".join(block))
                 block = [line]
+                block_chars = len(line)
             else:
                 block.append(line)
+                block_chars += added
         if block:
             final.append("\n".join(block))
     return final
@@ -250,11 +516,15 @@ def list_info():
     return jsonify({
         "count": len(items),
         "sample": items[:10],
-        "cached_at": SYMBOLS_CACHE["ts"]
+        "cached_at": SYMBOLS_CACHE["ts"],
+        "quote_cache": QUOTE_CACHE_STATS,
     })
 
-@app.get("/daily-push")
-def daily_push():
+# 掃描 + 推播可能要數十秒：丟到背景執行緒，路由立即回應（避免 cron/gunicorn 逾時重打）
+PUSH_EXECUTOR = ThreadPoolExecutor(max_workers=1)
+PUSH_LOCK = threading.Lock()  # 同時只跑一輪，重複觸發直接回 409
+
+def _run_daily_push() -> Tuple[str, int]:
     try:
         groups = pick_rising_all(
             min_change_pct=MIN_CHANGE_PCT,
@@ -263,23 +533,72 @@ def daily_push():
         )
         messages = make_messages(groups)
         errors = []
-        for m in messages:
-            ok, info = line_push(m)
+        # 每 5 則併成一次 push：請求數降為 1/5，且同批訊息順序不會亂
+        # 一輪頂多幾個 request，遠低於 LINE 的速率上限，批次之間不必再 sleep
+        for i in range(0, len(messages), LINE_MAX_MESSAGES_PER_PUSH):
+            ok, info = line_push(messages[i:i + LINE_MAX_MESSAGES_PER_PUSH])
             if not ok:
                 errors.append(info)
-            time.sleep(0.4)
         if errors:
             return "Sent with errors: " + " | ".join(errors), 206
         return "Push sent!", 200
     except Exception as e:
         app.logger.exception(e)
         return str(e), 500
+    finally:
+        PUSH_LOCK.release()
+
+def _run_daily_push_background() -> None:
+    body, status = _run_daily_push()
+    if status != 200:
+        app.logger.warning("daily push finished with %s: %s", status, body)
+
+@app.get("/daily-push")
+def daily_push():
+    if not PUSH_LOCK.acquire(blocking=False):
+        return "Busy: daily push already running", 409
+    # ?wait=1：同步執行並回傳推播結果（手動測試用）
+    if request.args.get("wait") == "1":
+        return _run_daily_push()
+    PUSH_EXECUTOR.submit(_run_daily_push_background)
+    return "Accepted", 202
 
 # 簡易 webhook（選用）
+def verify_line_signature(body: bytes, signature: str) -> bool:
+    """X-Line-Signature = base64(HMAC-SHA256(channel secret, 原始 body))；直接對 bytes 算，不先解碼成 str"""
+    h = LINE_SIGNATURE_HMAC.copy()
+    h.update(body)
+    return hmac.compare_digest(base64.b64encode(h.digest()), signature.encode("utf-8"))
+
 @app.post("/callback")
 def callback():
     # 保留給 LINE Webhook（若有需要）
+    if LINE_CHANNEL_SECRET:
+        signature = request.headers.get("X-Line-Signature", "")
+        if not signature:
+            return "missing signature", 400  # 沒帶簽章就不必讀 body、算 HMAC
+        if not verify_line_signature(request.get_data(cache=False), signature):
+            return "invalid signature", 400
     return "ok", 200
 
+# 健康檢查（uptime ping）很密集：GET/HEAD / 在進 Flask 之前就直接回，不建 request context
+HEALTH_BODY = b"OK"
+HEALTH_HEADERS = [
+    ("Content-Type", "text/html; charset=utf-8"),
+    ("Content-Length", str(len(HEALTH_BODY))),
+]
+
+def _health_fast_path(wsgi_app):
+    def middleware(environ, start_response):
+        if environ.get("PATH_INFO") == "/":
+            method = environ.get("REQUEST_METHOD")
+            if method in ("GET", "HEAD"):
+                start_response("200 OK", HEALTH_HEADERS)
+                return [HEALTH_BODY] if method == "GET" else [b""]
+        return wsgi_app(environ, start_response)
+    return middleware
+
+app.wsgi_app = _health_fast_path(app.wsgi_app)
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", "10000")))
\ No newline at end of file
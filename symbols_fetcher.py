@@ -4,7 +4,6 @@ import time
 import json
 import pandas as pd
 import requests
-from typing import Tuple
 
 # ---- 共用：簡單、安全重試 + UA 標頭（避免被擋） ----
 SESSION = requests.Session()
@@ -32,6 +31,11 @@ TWSE_ISIN_URL = "https://isin.twse.com.tw/isin/C_public.jsp?strMode=2"
 # ---- 來源 B：TPEx（上櫃） ----
 TPEX_ISIN_URL = "https://isin.tpex.org.tw/isin/C_public.jsp?strMode=4"
 
+# 整欄套用的 pattern 先編譯好（pandas 的 .str 方法可直接吃 compiled pattern）
+WS_RE          = re.compile(r"\s+")
+CODE_NAME_RE   = re.compile(r"^([A-Z0-9]{3,6})\s+(.+)$")  # 例：2330 臺積電
+NAME_REMARK_RE = re.compile(r"\s*\(.*?\)\s*$")          # 名稱尾端的括號備註
+
 def _parse_isin_html_table(html: str) -> pd.DataFrame:
     # 直接讓 pandas 幫我們把表格抓出來
     tables = pd.read_html(io.StringIO(html), header=0)
@@ -67,15 +71,13 @@ def _parse_isin_html_table(html: str) -> pd.DataFrame:
                                     ind_col if ind_col else "產業別": "industry"})
 
 
-def _split_code_name(val: str) -> Tuple[str, str]:
-    # 例：「2330　臺積電」或「0050　元大台灣50」
-    if not isinstance(val, str):
-        return "", ""
-    s = re.sub(r"\s+", " ", val).strip()
-    m = re.match(r"^([A-Z0-9]{3,6})\s+(.+)$", s)
-    if m:
-        return m.group(1), m.group(2)
-    return "", s
+def _split_code_name_col(col: pd.Series) -> pd.DataFrame:
+    # 例：「2330　臺積電」或「0050　元大台灣50」；非字串 → ("", "")、對不上代號 → ("", 原字串)
+    # 整欄一次處理：不再每列 apply 一個 lambda、也不再每列建一個 pd.Series
+    s = col.where(col.map(type) == str, "").astype(str)
+    s = s.str.replace(WS_RE, " ", regex=True).str.strip()
+    parts = s.str.extract(CODE_NAME_RE)
+    return pd.DataFrame({"code": parts[0].fillna(""), "name": parts[1].fillna(s)}, index=col.index)
 
 
 def fetch_twse_listed_and_etf() -> pd.DataFrame:
@@ -84,17 +86,15 @@ def fetch_twse_listed_and_etf() -> pd.DataFrame:
     if df.empty:
         return df
 
-    df[["code", "name"]] = df["code_name"].apply(lambda x: pd.Series(_split_code_name(x)))
+    df[["code", "name"]] = _split_code_name_col(df["code_name"])
     df.drop(columns=["code_name"], inplace=True)
 
-    # 判斷 ETF：市場別或產業別常會含有「ETF」字樣，或名稱含 ETF
-    def _classify(row):
-        txt = " ".join([str(row.get("market","")), str(row.get("industry","")), str(row.get("name",""))])
-        if "ETF" in txt.upper():
-            return "ETF"
-        return "LISTED"
-
-    df["board"] = df.apply(_classify, axis=1)
+    # 判斷 ETF：市場別或產業別常會含有「ETF」字樣，或名稱含 ETF（整欄比對，不逐列 apply）
+    is_etf = pd.Series(False, index=df.index)
+    for col in ("market", "industry", "name"):
+        if col in df.columns:
+            is_etf |= df[col].astype(str).str.upper().str.contains("ETF", regex=False)
+    df["board"] = is_etf.map({True: "ETF", False: "LISTED"})
     df = df[["code","name","board"]].dropna().drop_duplicates()
     df = df[df["code"].str.len() > 0]
     return df
@@ -105,7 +105,7 @@ def fetch_tpex_otc() -> pd.DataFrame:
     df = _parse_isin_html_table(html)
     if df.empty:
         return df
-    df[["code", "name"]] = df["code_name"].apply(lambda x: pd.Series(_split_code_name(x)))
+    df[["code", "name"]] = _split_code_name_col(df["code_name"])
     df.drop(columns=["code_name"], inplace=True)
     df["board"] = "OTC"
     df = df[["code","name","board"]].dropna().drop_duplicates()
@@ -129,7 +129,7 @@ def build_all_symbols() -> pd.DataFrame:
     all_df.drop(columns="__k", inplace=True)
 
     # 去除常見雜訊（如「*」或備註）
-    all_df["name"] = all_df["name"].str.replace(r"\s*\(.*?\)\s*$", "", regex=True).str.strip()
+    all_df["name"] = all_df["name"].str.replace(NAME_REMARK_RE, "", regex=True).str.strip()
     return all_df
 
 
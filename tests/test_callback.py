@@ -0,0 +1,54 @@
+import base64
+import hashlib
+import hmac
+import unittest
+from unittest import mock
+
+import app
+
+SECRET = "test-channel-secret"
+BODY = b'{"destination":"U0","events":[{"type":"message","message":{"type":"text","text":"\xe6\xb8\xac\xe8\xa9\xa6"}}]}'
+
+
+def _sign(body: bytes, secret: str = SECRET) -> str:
+    return base64.b64encode(hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()).decode("ascii")
+
+
+class CallbackSignatureTest(unittest.TestCase):
+    def setUp(self):
+        self.client = app.app.test_client()
+
+    def _with_secret(self, secret: str):
+        # 金鑰與預算好的 HMAC 都是 import 時建的，兩個一起換
+        return mock.patch.multiple(
+            app,
+            LINE_CHANNEL_SECRET=secret,
+            LINE_SIGNATURE_HMAC=hmac.new(secret.encode("utf-8"), digestmod=hashlib.sha256),
+        )
+
+    def _post(self, headers=None):
+        return self.client.post("/callback", data=BODY, headers=headers or {}, content_type="application/json")
+
+    def test_valid_signature(self):
+        with self._with_secret(SECRET):
+            r = self._post({"X-Line-Signature": _sign(BODY)})
+        self.assertEqual(r.status_code, 200)
+
+    def test_wrong_signature(self):
+        with self._with_secret(SECRET):
+            r = self._post({"X-Line-Signature": _sign(BODY, "other-secret")})
+        self.assertEqual(r.status_code, 400)
+
+    def test_missing_signature(self):
+        with self._with_secret(SECRET):
+            r = self._post()
+        self.assertEqual(r.status_code, 400)
+
+    def test_no_secret_configured_accepts_as_before(self):
+        with self._with_secret(""):
+            r = self._post()
+        self.assertEqual(r.status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
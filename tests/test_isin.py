@@ -0,0 +1,50 @@
+import os
+import unittest
+from unittest import mock
+
+import app
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+class FakePage:
+    def __init__(self, content: bytes):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+
+def _fixture(name: str) -> bytes:
+    with open(os.path.join(FIXTURES, name), "rb") as f:
+        return f.read()
+
+
+class FetchIsinTableTest(unittest.TestCase):
+    def _rows(self, name: str, market: str = "上市"):
+        with mock.patch.object(app.SESSION, "get", return_value=FakePage(_fixture(name))) as get:
+            rows = app._fetch_isin_table(app.TWSE_LISTED_URL, market)
+        self.assertEqual(get.call_args.args[0], app.TWSE_LISTED_URL)
+        return rows
+
+    def test_parses_cp950_rows(self):
+        # 表頭列、區段標題列、權證區段都不算；全形空白切代號/名稱、&amp; 要還原、2881A 這種帶字母的代號要收
+        self.assertEqual(self._rows("isin_listed.html"), [
+            ("1101", "台泥", "上市"),
+            ("1234", "A&B控股", "上市"),
+            ("2881A", "富邦特", "上市"),
+            ("0050", "元大台灣50", "上市"),
+        ])
+
+    def test_warrant_section_is_skipped_until_next_header(self):
+        codes = [code for code, _, _ in self._rows("isin_listed.html")]
+        # 權證區段內即使有長得像股票代號的列也不收；下一個區段（ETF）開始又照常收
+        self.assertNotIn("7001", codes)
+        self.assertEqual(codes[-1], "0050")
+
+    def test_market_label_is_passed_through(self):
+        self.assertEqual({m for _, _, m in self._rows("isin_listed.html", "上櫃")}, {"上櫃"})
+
+
+if __name__ == "__main__":
+    unittest.main()
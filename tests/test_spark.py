@@ -0,0 +1,85 @@
+import os
+import unittest
+from unittest import mock
+
+import app
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+class FakeResponse:
+    def __init__(self, content: bytes, status_code: int = 200):
+        self.content = content
+        self.status_code = status_code
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def _fixture(name: str) -> bytes:
+    with open(os.path.join(FIXTURES, name), "rb") as f:
+        return f.read()
+
+
+class FetchChangesBatchTest(unittest.TestCase):
+    def _batch(self, content: bytes, status_code: int = 200):
+        with mock.patch.object(app.SESSION, "get", return_value=FakeResponse(content, status_code)) as get:
+            out = app.fetch_changes_batch(["2330.TW", "1101.TW", "7777.TWO", "9999.TWO", "0000.TW"])
+        return out, get
+
+    def test_parses_v8_symbol_keyed_shape(self):
+        out, get = self._batch(_fixture("spark_v8_5d_1d.json"))
+        self.assertEqual(get.call_args.args[0], app.YAHOO_SPARK_URL)
+        self.assertEqual(get.call_args.kwargs["params"]["symbols"], "2330.TW,1101.TW,7777.TWO,9999.TWO,0000.TW")
+        self.assertEqual(get.call_args.kwargs["params"]["includeTimestamps"], "false")
+        # 2330：1050 對前一筆有效收盤 1025（中間的 null 要跳過）
+        self.assertEqual(out["2330.TW"], round((1050.0 - 1025.0) / 1025.0 * 100.0, 2))
+        # 1101：今天還沒有收盤（尾端 null），取最後兩筆有效值
+        self.assertEqual(out["1101.TW"], 0.0)
+        # 7777：區間內只有一筆，昨收取 chartPreviousClose
+        self.assertEqual(out["7777.TWO"], 10.0)
+        # 9999：close 為 null；0000：回應裡沒有 → 都不在結果中
+        self.assertNotIn("9999.TWO", out)
+        self.assertNotIn("0000.TW", out)
+
+    def test_error_payload_and_status_yield_nothing(self):
+        out, _ = self._batch(b'{"finance": {"result": null, "error": {"code": "Not Found"}}}')
+        self.assertEqual(out, {})
+        out, _ = self._batch(b"", status_code=404)
+        self.assertEqual(out, {})
+
+
+class FetchChangesPrefilterTest(unittest.TestCase):
+    def setUp(self):
+        app.QUOTE_CACHE.clear()
+        app.SPARK_CACHE.clear()
+
+    def test_only_spark_survivors_and_spark_misses_hit_chart(self):
+        spark = _fixture("spark_v8_5d_1d.json")
+        chart_calls = []
+
+        def fake_get(url, params=None, **kw):
+            return FakeResponse(spark)
+
+        def fake_chart(ysym):
+            chart_calls.append(ysym)
+            return (5.0, 1000)
+
+        syms = ["2330.TW", "1101.TW", "7777.TWO", "0000.TW"]
+        with mock.patch.object(app.SESSION, "get", side_effect=fake_get), \
+                mock.patch.object(app, "fetch_change_pct_and_volume", side_effect=fake_chart):
+            quotes = app.fetch_changes(syms, min_change_pct=0.5)
+            # 1101 漲幅 0%：spark 就淘汰，不打 chart；0000 spark 沒回：交給 chart
+            self.assertEqual(sorted(chart_calls), ["0000.TW", "2330.TW", "7777.TWO"])
+            self.assertEqual(sorted(quotes), ["0000.TW", "2330.TW", "7777.TWO"])
+            # TTL 內再掃一次：全部走快取
+            chart_calls.clear()
+            self.assertEqual(app.fetch_changes(syms, min_change_pct=0.5), quotes)
+            self.assertEqual(chart_calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
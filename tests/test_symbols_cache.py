@@ -0,0 +1,35 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import app
+
+
+class SymbolsFileCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patcher = mock.patch.object(app, "SYMBOLS_CACHE_DIR", self.tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _touch(self, name: str):
+        with open(os.path.join(self.tmp.name, name), "wb") as f:
+            f.write(b"[]")
+
+    def test_save_keeps_only_newest_files(self):
+        for day in ("20250101", "20250102", "20250103"):
+            self._touch(f"symbols_{day}.json")
+        self._touch("unrelated.json")
+        with mock.patch.object(app, "_symbols_cache_path",
+                               return_value=os.path.join(self.tmp.name, "symbols_20250104.json")):
+            app._save_symbols_file([{"code": "2330"}])
+        self.assertEqual(sorted(os.listdir(self.tmp.name)),
+                         ["symbols_20250103.json", "symbols_20250104.json", "unrelated.json"])
+        self.assertEqual(app._latest_symbols_file(), os.path.join(self.tmp.name, "symbols_20250104.json"))
+        self.assertEqual(app._load_symbols_file(app._latest_symbols_file()), [{"code": "2330"}])
+
+
+if __name__ == "__main__":
+    unittest.main()